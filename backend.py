@@ -5,19 +5,17 @@ Run with: python backend.py
 
 from fastapi import FastAPI, File, UploadFile, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, StreamingResponse
 import pandas as pd
+import pyarrow as pa
 import duckdb
 import os
+import io
+import re
 import aiofiles
-import subprocess
-import json
-from typing import List, Dict, Any, Optional
 from pathlib import Path
-import sqlparse
-from datetime import datetime
-import shutil
-import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 import logging
 
 # Set up logging
@@ -40,78 +38,338 @@ app.add_middleware(
 DATABASE_PATH = "./queryverse.db"
 UPLOAD_DIR = "./uploads"
 DBT_DIR = "./dbt_models"
+DUCKDB_TEMP_DIR = "./duckdb_tmp"
+ARROW_STREAM_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+ARROW_BATCH_ROWS = 1_000_000  # rows per streamed Arrow record batch
+DUCKDB_THREADS = os.cpu_count() or 4
+MAX_JSON_ROWS = 10_000  # JSON responses are capped; use ?format=arrow for full results
 
 # Ensure directories exist
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 os.makedirs(DBT_DIR, exist_ok=True)
+os.makedirs(DUCKDB_TEMP_DIR, exist_ok=True)
+
+_IDENTIFIER_RE = re.compile(r'[a-z_][a-z0-9_]*')
+_UNSAFE_CHARS_RE = re.compile(r'[^a-z0-9_]')
+# Statements /query refuses to run, checked per statement after comments, literals and quoted
+# names are blanked. COPY is only refused when a TO follows it in the same statement
+_FORBIDDEN_SQL_RE = re.compile(r'(?i)\b(drop|truncate|attach)\b')
+_COPY_RE = re.compile(r'(?i)\bcopy\b')
+_TO_RE = re.compile(r'(?i)\bto\b')
+# Comments, string literals (plain, E'' escaped, $tag$ quoted) and quoted identifiers, matched
+# left to right in one pass so that e.g. a quote inside a comment can't open a fake literal.
+# Unterminated ones run to the end of the input, which keeps matching linear
+_SQL_NON_CODE_RE = re.compile(
+    r"""--[^\n]*|/\*.*?(?:\*/|\Z)|\b[eE]'(?:[^'\\]|\\.|'')*(?:'|\Z)|'(?:[^']|'')*(?:'|\Z)"""
+    r"""|"(?:[^"]|"")*(?:"|\Z)|\$((?:[A-Za-z_]\w*)?)\$.*?(?:\$\1\$|\Z)""",
+    re.S
+)
+
+def _validate_identifier(name: str) -> str:
+    """Return name if it is a plain lowercase SQL identifier, otherwise raise ValueError"""
+    if not _IDENTIFIER_RE.fullmatch(name):
+        raise ValueError(f"Invalid table name: {name!r}")
+    return name
+
+def _check_query_allowed(query: str):
+    """Raise ValueError if a user query drops, truncates, attaches or exports data"""
+    stripped = _SQL_NON_CODE_RE.sub(" ", query)
+    for statement in stripped.split(";"):
+        match = _FORBIDDEN_SQL_RE.search(statement)
+        if match:
+            raise ValueError(f"{match.group(1).upper()} statements are not allowed in queries")
+        copy = _COPY_RE.search(statement)
+        if copy and _TO_RE.search(statement, copy.end()):
+            raise ValueError("COPY statements are not allowed in queries")
+
+def _qident(name: str) -> str:
+    """Quote an identifier for use in generated SQL"""
+    return '"' + str(name).replace('"', '""') + '"'
+
+def _qliteral(value: str) -> str:
+    """Quote a string literal for use in generated SQL"""
+    return "'" + str(value).replace("'", "''") + "'"
+
+def _unique_names(names):
+    """Suffix repeated names (a_b, a_b_1, ...) so every column stays addressable"""
+    seen = set()
+    unique = []
+    for name in names:
+        candidate, n = name, 1
+        while candidate in seen:
+            candidate = f"{name}_{n}"
+            n += 1
+        seen.add(candidate)
+        unique.append(candidate)
+    return unique
+
+def _memory_limit():
+    """70% of physical memory as a DuckDB size string, or None where it can't be determined"""
+    try:
+        total_bytes = os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    except (AttributeError, ValueError, OSError):
+        return None
+    return f"{int(total_bytes * 0.7) // (1024 * 1024)}MiB"
+
+def _json_converter(arrow_type):
+    """Return a function turning an Arrow-only value into what fetchall() gave the JSON API, or None"""
+    if arrow_type == pa.month_day_nano_interval():
+        # DuckDB counts a month as 30 days when it converts intervals to timedelta
+        return lambda v: timedelta(days=30 * v.months + v.days, microseconds=v.nanoseconds // 1000)
+    if pa.types.is_map(arrow_type):
+        return dict
+    if isinstance(arrow_type, pa.BaseExtensionType):
+        # DuckDB 1.2 exports UHUGEINT as an opaque 16-byte little-endian integer
+        if getattr(arrow_type, "type_name", None) == "uhugeint":
+            return lambda v: int.from_bytes(v, "little")
+        arrow_type = arrow_type.storage_type
+    if pa.types.is_binary(arrow_type) or pa.types.is_large_binary(arrow_type) or pa.types.is_fixed_size_binary(arrow_type):
+        # BLOB, BIT and VARINT arrive as raw bytes, which JSON can't carry
+        return bytes.hex
+    return None
+
+def _json_rows(table: pa.Table):
+    """table.to_pylist() with top-level Arrow-only values converted for the JSON encoder"""
+    converters = {}
+    for field in table.schema:
+        converter = _json_converter(field.type)
+        if converter:
+            converters[field.name] = converter
+    
+    rows = table.to_pylist()
+    if converters:
+        for row in rows:
+            for name, converter in converters.items():
+                if row[name] is not None:
+                    row[name] = converter(row[name])
+    return rows
+
+def _drop_relation(conn, schema: str, name: str):
+    """Drop schema.name whether it is currently a table or a view"""
+    row = conn.execute(
+        "SELECT table_type FROM information_schema.tables WHERE table_schema = ? AND table_name = ?",
+        [schema, name]
+    ).fetchone()
+    if row:
+        kind = "VIEW" if row[0] == "VIEW" else "TABLE"
+        conn.execute(f"DROP {kind} {schema}.{_qident(name)}")
 
 class DataManager:
     """Handles all data operations"""
     
     def __init__(self):
         self.db_path = DATABASE_PATH
+        # One long-lived connection; requests work on cheap cursors that share its buffer pool
+        self.conn = duckdb.connect(self.db_path)
+        
+        # Bumped after every change to tables or data; read-mostly endpoints cache against it
+        self.catalog_version = 0
+        self._tables_cache = (-1, None)
+        self._analytics_cache = (-1, None)
+        
+        # Set by init_database once DuckDB's excel extension is loaded
+        self.excel_extension = False
+        
         self.init_database()
     
+    def invalidate_cache(self):
+        """Mark cached table listings and analytics as stale"""
+        self.catalog_version += 1
+    
     def init_database(self):
         """Initialize database with basic schema"""
         try:
-            conn = duckdb.connect(self.db_path)
+            conn = self.conn
+            
+            # Runtime tuning: use every core, leave 30% of RAM for pandas/Arrow, spill to a local
+            # temp dir, and checkpoint the WAL less often. That trades recovery time after a crash
+            # for ingest throughput; raw data itself lives in Parquet files written outside the WAL
+            conn.execute(f"SET threads = {DUCKDB_THREADS}")
+            memory_limit = _memory_limit()
+            if memory_limit:
+                conn.execute(f"SET memory_limit = {_qliteral(memory_limit)}")
+            conn.execute(f"SET temp_directory = {_qliteral(DUCKDB_TEMP_DIR)}")
+            conn.execute("SET checkpoint_threshold = '1GB'")
+            
+            # Load the excel extension once so .xlsx uploads are read natively
+            try:
+                conn.execute("INSTALL excel")
+                conn.execute("LOAD excel")
+                self.excel_extension = True
+            except Exception as e:
+                logger.warning(f"DuckDB excel extension unavailable, Excel uploads will use pandas: {e}")
+            
             conn.execute("CREATE SCHEMA IF NOT EXISTS raw")
             conn.execute("CREATE SCHEMA IF NOT EXISTS staging") 
             conn.execute("CREATE SCHEMA IF NOT EXISTS marts")
             logger.info("Database initialized successfully")
-            conn.close()
         except Exception as e:
             logger.error(f"Database initialization failed: {e}")
     
-    def create_raw_table(self, filename: str, df: pd.DataFrame):
-        """Create raw table from uploaded data"""
+    def create_raw_table(self, filename: str, file_path: str, df: pd.DataFrame = None):
+        """Create raw table straight from the uploaded file using DuckDB's native readers"""
         try:
-            conn = duckdb.connect(self.db_path)
+            conn = self.conn.cursor()
             
             # Clean filename for table name
             table_name = filename.lower().replace('.csv', '').replace('.xlsx', '').replace('.xls', '')
-            table_name = ''.join(c if c.isalnum() or c == '_' else '_' for c in table_name)
-            table_name = f"raw_{table_name}"
-            
-            # Clean column names
-            df.columns = [str(col).lower().replace(' ', '_').replace('-', '_').replace('.', '_') 
-                         for col in df.columns]
-            
-            # Remove any completely empty columns
-            df = df.dropna(axis=1, how='all')
+            table_name = _UNSAFE_CHARS_RE.sub('_', table_name)
+            table_name = _validate_identifier(f"raw_{table_name}")
             
-            # Replace NaN with None for better handling
-            df = df.where(pd.notnull(df), None)
-            
-            # Drop and recreate table
-            conn.execute(f"DROP TABLE IF EXISTS raw.{table_name}")
-            
-            # Create table from dataframe
-            conn.register('temp_df', df)
-            conn.execute(f"CREATE TABLE raw.{table_name} AS SELECT * FROM temp_df")
+            # Write the data to Parquet once, next to the live file
+            parquet_path = os.path.abspath(os.path.join(UPLOAD_DIR, f"{table_name}.parquet"))
+            tmp_path = f"{parquet_path}.tmp"
+            try:
+                # Pick the source: DuckDB reads the file directly unless a DataFrame is given
+                if df is None and file_path.lower().endswith('.csv'):
+                    columns, row_count = self._load_csv(conn, file_path, tmp_path)
+                else:
+                    params = []
+                    if df is None:
+                        source, params, df = self._excel_source(conn, file_path)
+                    
+                    if df is not None:
+                        # DuckDB reads NaN as NULL itself and all-empty columns cost next to nothing, so
+                        # the frame is scanned in place (zero-copy for numeric columns). Bulk loads from
+                        # pandas should always go through register/from_df or conn.append, never
+                        # row-by-row INSERTs
+                        conn.register('temp_df', df)
+                        source = "temp_df"
+                        params = []
+                    
+                    columns, row_count = self._copy_to_parquet(conn, source, params, tmp_path)
+                
+                # An empty file leaves any earlier upload under this name untouched
+                if row_count == 0:
+                    logger.warning(f"No rows loaded from {file_path}; keeping existing raw.{table_name}")
+                    conn.close()
+                    return {"table_name": table_name, "columns": columns, "rows": 0}
+                
+                # Swap the raw relation for a view over the new Parquet file in a single transaction
+                conn.execute("BEGIN")
+                try:
+                    _drop_relation(conn, "raw", table_name)
+                    os.replace(tmp_path, parquet_path)
+                    conn.execute(f"CREATE VIEW raw.{table_name} AS "
+                                 f"SELECT * FROM parquet_scan({_qliteral(parquet_path)})")
+                    conn.execute("COMMIT")
+                except Exception:
+                    conn.execute("ROLLBACK")
+                    raise
+                finally:
+                    self.invalidate_cache()
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
             
-            # Verify table was created
-            result = conn.execute(f"SELECT COUNT(*) FROM raw.{table_name}").fetchone()
-            logger.info(f"Created table raw.{table_name} with {result[0]} rows")
+            logger.info(f"Created view raw.{table_name} over {parquet_path} with {row_count} rows")
             
             conn.close()
-            return table_name
+            return {"table_name": table_name, "columns": columns, "rows": row_count}
             
         except Exception as e:
             logger.error(f"Failed to create table: {e}")
             raise e
     
+    def _copy_to_parquet(self, conn, source: str, params: list, path: str):
+        """COPY source to a Parquet file with cleaned column names; return (columns, row_count)"""
+        # Clean column names in SQL rather than renaming a DataFrame
+        source_columns = [row[0] for row in conn.execute(f"DESCRIBE SELECT * FROM {source}", params).fetchall()]
+        # Distinct headers like "a b" and "a-b" clean to the same name, so de-duplicate afterwards
+        columns = _unique_names(_UNSAFE_CHARS_RE.sub('_', str(col).lower()) for col in source_columns)
+        select_list = ", ".join(f"{_qident(src)} AS {_qident(col)}"
+                                for src, col in zip(source_columns, columns))
+        
+        # COPY reports the row count
+        row_count = conn.execute(
+            f"COPY (SELECT {select_list} FROM {source}) TO {_qliteral(path)} "
+            f"(FORMAT PARQUET, COMPRESSION ZSTD)", params
+        ).fetchone()[0]
+        return columns, row_count
+    
+    def _load_csv(self, conn, file_path: str, path: str):
+        """Load a CSV into a Parquet file, rereading it as latin-1 if it isn't valid UTF-8"""
+        for encoding in ("utf-8", "latin-1"):
+            # Rejects tables accumulate on a connection, so start each load with empty ones. They
+            # live in temp; qualify them so a user's main.reject_errors is never touched
+            conn.execute("DROP TABLE IF EXISTS temp.reject_errors")
+            conn.execute("DROP TABLE IF EXISTS temp.reject_scans")
+            
+            source, params = self._csv_source(conn, file_path, encoding)
+            columns, row_count = self._copy_to_parquet(conn, source, params, path)
+            rejects = dict(conn.execute(
+                "SELECT error_type, COUNT(*) FROM temp.reject_errors GROUP BY error_type"
+            ).fetchall())
+            if not rejects:
+                return columns, row_count
+            # DuckDB 1.2 reports decode failures as INVALID UNICODE, later releases as INVALID ENCODING
+            if not rejects.keys() & {"INVALID UNICODE", "INVALID ENCODING"}:
+                break
+            logger.info(f"{file_path} is not valid UTF-8, reloading it as latin-1")
+        
+        # ignore_errors skipped these rows; fail so the upload can fall back instead of losing them
+        raise ValueError(f"DuckDB rejected {sum(rejects.values())} CSV rows: {rejects}")
+    
+    def _csv_source(self, conn, file_path: str, encoding: str = "utf-8"):
+        """Sniff a sample of a CSV and return a read_csv source with the detected dialect pinned"""
+        # The default sample keeps sniffing to one partial read; rows past it that don't fit the
+        # sniffed types end up in reject_errors, and _load_csv falls back rather than dropping them
+        result = conn.execute(
+            "SELECT * FROM sniff_csv(?, encoding=?, ignore_errors=true, null_padding=true, strict_mode=false)",
+            [file_path, encoding]
+        )
+        sniff = dict(zip([desc[0] for desc in result.description], result.fetchone()))
+        
+        # sniff_csv reports unset single-character options as '(empty)'
+        options = {
+            "encoding": encoding,
+            "delim": sniff["Delimiter"],
+            "quote": '' if sniff["Quote"] == '(empty)' else sniff["Quote"],
+            "escape": '' if sniff["Escape"] == '(empty)' else sniff["Escape"],
+            "header": sniff["HasHeader"],
+            "skip": sniff["SkipRows"],
+            "columns": {col["name"]: col["type"] for col in sniff["Columns"]},
+        }
+        if sniff["DateFormat"]:
+            options["dateformat"] = sniff["DateFormat"]
+        if sniff["TimestampFormat"]:
+            options["timestampformat"] = sniff["TimestampFormat"]
+        
+        # Ragged rows are padded with NULLs; rows that still don't parse are skipped and recorded
+        # in reject_errors for _load_csv to check
+        option_sql = ", ".join(f"{name}=?" for name in options)
+        source = (f"read_csv(?, {option_sql}, auto_detect=false, ignore_errors=true, "
+                  f"null_padding=true, strict_mode=false, store_rejects=true)")
+        return source, [file_path, *options.values()]
+    
+    def _excel_source(self, conn, file_path: str):
+        """Return a SQL source for an Excel file, or a DataFrame for files DuckDB can't read"""
+        if self.excel_extension and file_path.lower().endswith('.xlsx'):
+            try:
+                source = "read_xlsx(?, header=true)"
+                conn.execute(f"DESCRIBE SELECT * FROM {source}", [file_path])
+                return source, [file_path], None
+            except Exception as e:
+                logger.warning(f"DuckDB Excel reader failed, falling back to pandas: {e}")
+        
+        # calamine parses .xlsx and legacy .xls in Rust, well ahead of openpyxl/xlrd
+        return None, [], pd.read_excel(file_path, engine='calamine')
+    
     def get_tables(self):
         """Get all tables"""
+        # Read the version first so a change made while we scan leaves the entry stale
+        version = self.catalog_version
+        cached_version, cached_tables = self._tables_cache
+        if cached_version == version:
+            return cached_tables
+        
         try:
-            conn = duckdb.connect(self.db_path)
+            conn = self.conn.cursor()
             result = conn.execute("""
-                SELECT table_schema, table_name, 
-                       (SELECT COUNT(*) FROM information_schema.columns 
-                        WHERE table_schema = t.table_schema AND table_name = t.table_name) as column_count
-                FROM information_schema.tables t
+                SELECT table_schema, table_name, COUNT(*) as column_count
+                FROM information_schema.columns
                 WHERE table_schema NOT IN ('information_schema', 'pg_catalog', 'main')
+                GROUP BY table_schema, table_name
                 ORDER BY table_schema, table_name
             """).fetchall()
             conn.close()
@@ -125,34 +383,143 @@ class DataManager:
                     "columns": row[2]
                 })
             
+            self._tables_cache = (version, tables)
             return tables
             
         except Exception as e:
             logger.error(f"Failed to get tables: {e}")
             return []
     
+    def get_analytics(self):
+        """Get table, row and schema totals"""
+        # Serve the cached summary until tables or data change
+        version = self.catalog_version
+        cached_version, cached_summary = self._analytics_cache
+        if cached_version == version:
+            return cached_summary
+        
+        tables = self.get_tables()
+        
+        # Get row counts for every table in a single query
+        total_rows = 0
+        conn = self.conn.cursor()
+        
+        if tables:
+            count_query = " UNION ALL ".join(
+                f"SELECT COUNT(*) FROM {table['schema']}.{_qident(table['name'])}" for table in tables
+            )
+            try:
+                total_rows = sum(row[0] for row in conn.execute(count_query).fetchall())
+            except Exception as e:
+                # One unreadable table (e.g. a missing Parquet file) fails the union, so count individually
+                logger.warning(f"Combined row count failed, counting tables one by one: {e}")
+                for table in tables:
+                    try:
+                        result = conn.execute(
+                            f"SELECT COUNT(*) FROM {table['schema']}.{_qident(table['name'])}"
+                        ).fetchone()
+                        if result:
+                            total_rows += result[0]
+                    except Exception as e:
+                        logger.warning(f"Failed to count rows for {table['full_name']}: {e}")
+                        continue
+        
+        conn.close()
+        
+        summary = {
+            "total_tables": len(tables),
+            "total_rows": total_rows,
+            "last_updated": datetime.now().isoformat(),
+            "schemas": list(set(table["schema"] for table in tables))
+        }
+        self._analytics_cache = (version, summary)
+        return summary
+    
     def execute_query(self, query: str):
         """Execute SQL query"""
         try:
-            conn = duckdb.connect(self.db_path)
-            result = conn.execute(query).fetchall()
-            columns = [desc[0] for desc in conn.description] if conn.description else []
+            _check_query_allowed(query)
+            conn = self.conn.cursor()
+            reader = conn.execute(query).fetch_record_batch(MAX_JSON_ROWS)
+            
+            # Pull one row past the cap so we know whether the result was cut off
+            batches, fetched = [], 0
+            for batch in reader:
+                batches.append(batch)
+                fetched += batch.num_rows
+                if fetched > MAX_JSON_ROWS:
+                    break
             conn.close()
             
+            table = pa.Table.from_batches(batches, schema=reader.schema).slice(0, MAX_JSON_ROWS)
             return {
                 "success": True,
-                "data": [dict(zip(columns, row)) for row in result],
-                "columns": columns,
-                "row_count": len(result)
+                "data": _json_rows(table),
+                "columns": table.column_names,
+                "row_count": table.num_rows,
+                "truncated": fetched > MAX_JSON_ROWS
             }
         except Exception as e:
             logger.error(f"Query execution failed: {e}")
             return {"success": False, "error": str(e)}
+        finally:
+            if not self._is_read_only(query):
+                self.invalidate_cache()
+    
+    def _is_read_only(self, query: str) -> bool:
+        """True if every statement in query is a plain SELECT that can't change tables or row counts"""
+        # DuckDB's parser sees through CTEs (WITH ... INSERT) and reports DESCRIBE/SHOW/SUMMARIZE
+        # as SELECT. EXPLAIN ANALYZE executes its statement, so every EXPLAIN counts as a write
+        try:
+            statements = self.conn.extract_statements(query)
+        except Exception:
+            return False
+        return all(statement.type == duckdb.StatementType.SELECT for statement in statements)
+    
+    def stream_query_arrow(self, query: str):
+        """Execute SQL query and return a generator of Arrow IPC stream chunks"""
+        _check_query_allowed(query)
+        conn = self.conn.cursor()
+        try:
+            reader = conn.execute(query).fetch_record_batch(ARROW_BATCH_ROWS)
+        except Exception:
+            conn.close()
+            raise
+        finally:
+            if not self._is_read_only(query):
+                self.invalidate_cache()
+        
+        def generate():
+            try:
+                sink = io.BytesIO()
+                with pa.ipc.new_stream(sink, reader.schema) as writer:
+                    for batch in reader:
+                        writer.write_batch(batch)
+                        yield sink.getvalue()
+                        sink.seek(0)
+                        sink.truncate()
+                # End-of-stream marker written when the writer closes
+                yield sink.getvalue()
+            finally:
+                conn.close()
+        
+        return generate()
 
 class SimpleDBTManager:
     """Simplified DBT manager that works without complex setup"""
     
-    def __init__(self):
+    # Staging models are views, so building them copies no data
+    STAGING_SQL = """
+    CREATE VIEW staging.stg_{table_name} AS
+    SELECT 
+        *,
+        CURRENT_TIMESTAMP as _loaded_at,
+        {source_table} as _source_table
+    FROM raw.{table_name}
+    """
+    
+    def __init__(self, data_manager: DataManager):
+        self.data_manager = data_manager
         self.dbt_dir = Path(DBT_DIR)
         self.init_simple_dbt()
     
@@ -179,7 +546,8 @@ class SimpleDBTManager:
         try:
             model_sql = f"""
 -- Staging model for {table_name}
--- This is a simple transformation example
+-- A view: the two metadata columns are computed at scan time instead of copying the raw data
+{{{{ config(materialized='view') }}}}
 SELECT 
     *,
     CURRENT_TIMESTAMP as _loaded_at,
@@ -201,33 +569,21 @@ FROM raw.{table_name}
     def run_transformation(self, table_name: str):
         """Run a simple transformation without full DBT"""
         try:
-            conn = duckdb.connect(DATABASE_PATH)
+            conn = self.data_manager.conn.cursor()
             
             # Create staging schema if not exists
             conn.execute("CREATE SCHEMA IF NOT EXISTS staging")
             
-            # Create a simple staging table
-            staging_query = f"""
-            CREATE OR REPLACE TABLE staging.stg_{table_name} AS
-            SELECT 
-                *,
-                CURRENT_TIMESTAMP as _loaded_at,
-                '{table_name}' as _source_table
-            FROM raw.{table_name}
-            """
-            
-            conn.execute(staging_query)
-            
-            # Get row count
-            result = conn.execute(f"SELECT COUNT(*) FROM staging.stg_{table_name}").fetchone()
-            row_count = result[0]
+            # Create a simple staging view
+            row_count = self._stage_table(conn, table_name)
             
             conn.close()
             
             return {
                 "success": True,
                 "message": f"Created staging.stg_{table_name} with {row_count} rows",
-                "table_created": f"staging.stg_{table_name}"
+                "table_created": f"staging.stg_{table_name}",
+                "row_count": row_count
             }
             
         except Exception as e:
@@ -237,31 +593,61 @@ FROM raw.{table_name}
                 "error": str(e)
             }
     
+    def _stage_table(self, conn, table_name: str):
+        """Build staging.stg_<table_name> and return its row count"""
+        # Views can't take parameters, so the validated name is inlined and the source quoted
+        _validate_identifier(table_name)
+        staging_query = self.STAGING_SQL.format(table_name=table_name, source_table=_qliteral(table_name))
+        # Swap in a single transaction so a view that fails to bind leaves the old one in place
+        conn.execute("BEGIN")
+        try:
+            _drop_relation(conn, "staging", f"stg_{table_name}")
+            conn.execute(staging_query)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            self.data_manager.invalidate_cache()
+        return conn.execute(f"SELECT COUNT(*) FROM staging.stg_{table_name}").fetchone()[0]
+    
     def run_simple_dbt(self, command: str):
         """Run simple DBT-like operations"""
         try:
             if command == "run":
                 # Get all raw tables and create staging versions
-                conn = duckdb.connect(DATABASE_PATH)
+                conn = self.data_manager.conn.cursor()
                 tables = conn.execute("""
                     SELECT table_name FROM information_schema.tables 
                     WHERE table_schema = 'raw'
                 """).fetchall()
-                conn.close()
                 
                 if not tables:
+                    conn.close()
                     return {
                         "success": False,
                         "stdout": "",
                         "stderr": "No raw tables found to transform"
                     }
                 
+                # Tables created outside uploads may not have names we can safely inline
                 results = []
+                valid_tables = []
                 for table in tables:
-                    table_name = table[0]
-                    result = self.run_transformation(table_name)
+                    if _IDENTIFIER_RE.fullmatch(table[0]):
+                        valid_tables.append(table[0])
+                    else:
+                        results.append(f"❌ Skipped {table[0]}: not a plain lowercase identifier")
+                
+                # Build staging views in parallel, one cursor per worker
+                conn.execute("CREATE SCHEMA IF NOT EXISTS staging")
+                conn.close()
+                with ThreadPoolExecutor(max_workers=DUCKDB_THREADS) as executor:
+                    outcomes = list(executor.map(self.run_transformation, valid_tables))
+                
+                for table_name, result in zip(valid_tables, outcomes):
                     if result["success"]:
-                        results.append(f"✅ Transformed {table_name}")
+                        results.append(f"✅ Transformed {table_name} ({result['row_count']} rows)")
                     else:
                         results.append(f"❌ Failed to transform {table_name}: {result['error']}")
                 
@@ -273,7 +659,7 @@ FROM raw.{table_name}
                 
             elif command == "test":
                 # Simple data quality tests
-                conn = duckdb.connect(DATABASE_PATH)
+                conn = self.data_manager.conn.cursor()
                 tests = []
                 
                 # Test 1: Check for empty tables
@@ -284,7 +670,7 @@ FROM raw.{table_name}
                 
                 for table in staging_tables:
                     table_name = table[0]
-                    count = conn.execute(f"SELECT COUNT(*) FROM staging.{table_name}").fetchone()[0]
+                    count = conn.execute(f"SELECT COUNT(*) FROM staging.{_qident(table_name)}").fetchone()[0]
                     if count > 0:
                         tests.append(f"✅ staging.{table_name} has {count} rows")
                     else:
@@ -300,15 +686,14 @@ FROM raw.{table_name}
                 
             elif command == "docs generate":
                 # Generate simple documentation
-                conn = duckdb.connect(DATABASE_PATH)
+                conn = self.data_manager.conn.cursor()
                 
                 # Get table information
                 tables_info = conn.execute("""
-                    SELECT table_schema, table_name, 
-                           (SELECT COUNT(*) FROM information_schema.columns 
-                            WHERE table_schema = t.table_schema AND table_name = t.table_name) as column_count
-                    FROM information_schema.tables t
+                    SELECT table_schema, table_name, COUNT(*) as column_count
+                    FROM information_schema.columns
                     WHERE table_schema IN ('raw', 'staging')
+                    GROUP BY table_schema, table_name
                     ORDER BY table_schema, table_name
                 """).fetchall()
                 
@@ -344,9 +729,23 @@ FROM raw.{table_name}
                 "stderr": str(e)
             }
 
+def read_csv_with_pandas(file_path: str) -> pd.DataFrame:
+    """Fallback CSV reader for files DuckDB's native reader rejects"""
+    # Try UTF-8 first so valid text isn't garbled; latin-1 decodes any byte sequence
+    for encoding in ('utf-8', 'latin-1'):
+        try:
+            df = pd.read_csv(file_path, encoding=encoding, on_bad_lines='skip')
+            logger.info(f"Pandas fallback successful with {encoding}! DataFrame shape: {df.shape}")
+            return df
+        except UnicodeDecodeError:
+            continue
+        except Exception as e:
+            logger.error(f"Pandas fallback also failed: {e}")
+            raise HTTPException(status_code=400, detail=f"Unable to parse CSV file. The file appears to be malformed. Error: {str(e)}")
+
 # Initialize managers
 data_manager = DataManager()
-dbt_manager = SimpleDBTManager()
+dbt_manager = SimpleDBTManager(data_manager)
 
 # Routes
 @app.get("/")
@@ -372,122 +771,41 @@ async def upload_file(file: UploadFile = File(...)):
         # Save file to disk
         file_path = os.path.join(UPLOAD_DIR, file.filename)
         
-        # Read file content
-        content = await file.read()
-        
-        # Write to disk
-        with open(file_path, 'wb') as f:
-            f.write(content)
+        # Stream to disk in 1MB chunks so large uploads never sit fully in memory
+        async with aiofiles.open(file_path, 'wb') as out:
+            while chunk := await file.read(1 << 20):
+                await out.write(chunk)
         
         logger.info(f"File saved to: {file_path}")
         
-        # Read file into DataFrame with robust CSV handling
+        # Load the file straight into DuckDB
+        table_info = None
         try:
-            if file_ext == '.csv':
-                # Try multiple strategies for reading CSV files
-                df = None
-                strategies = [
-                    # Strategy 1: Standard reading
-                    {'encoding': 'utf-8'},
-                    {'encoding': 'latin-1'},
-                    {'encoding': 'cp1252'},
-                    # Strategy 2: Handle malformed CSV with error handling
-                    {'encoding': 'utf-8', 'error_bad_lines': False, 'warn_bad_lines': True},
-                    {'encoding': 'latin-1', 'error_bad_lines': False, 'warn_bad_lines': True},
-                    # Strategy 3: More robust parsing
-                    {'encoding': 'utf-8', 'sep': ',', 'quotechar': '"', 'on_bad_lines': 'skip'},
-                    {'encoding': 'latin-1', 'sep': ',', 'quotechar': '"', 'on_bad_lines': 'skip'},
-                    # Strategy 4: Very permissive parsing
-                    {'encoding': 'utf-8', 'sep': ',', 'quotechar': '"', 'on_bad_lines': 'skip', 'skipinitialspace': True},
-                    # Strategy 5: Last resort - read with no header inference
-                    {'encoding': 'utf-8', 'header': None, 'on_bad_lines': 'skip'},
-                ]
-                
-                for i, strategy in enumerate(strategies):
-                    try:
-                        logger.info(f"Trying CSV parsing strategy {i+1}: {strategy}")
-                        df = pd.read_csv(file_path, **strategy)
-                        logger.info(f"Strategy {i+1} successful! DataFrame shape: {df.shape}")
-                        break
-                    except Exception as e:
-                        logger.warning(f"Strategy {i+1} failed: {e}")
-                        continue
-                
-                # If all strategies failed, try reading line by line and fixing issues
-                if df is None:
-                    logger.info("All standard strategies failed. Trying manual line-by-line parsing...")
-                    try:
-                        # Read file line by line and clean it
-                        with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                            lines = f.readlines()
-                        
-                        # Get the header
-                        header = lines[0].strip().split(',')
-                        expected_cols = len(header)
-                        logger.info(f"Expected columns: {expected_cols}, Header: {header}")
-                        
-                        # Clean the data lines
-                        cleaned_lines = [lines[0]]  # Keep header
-                        for i, line in enumerate(lines[1:], 2):
-                            parts = line.strip().split(',')
-                            if len(parts) == expected_cols:
-                                cleaned_lines.append(line)
-                            elif len(parts) > expected_cols:
-                                # Try to merge extra fields
-                                fixed_parts = parts[:expected_cols-1] + [','.join(parts[expected_cols-1:])]
-                                cleaned_lines.append(','.join(fixed_parts) + '\n')
-                                logger.warning(f"Fixed line {i}: had {len(parts)} fields, expected {expected_cols}")
-                            else:
-                                # Skip lines with too few fields
-                                logger.warning(f"Skipped line {i}: had {len(parts)} fields, expected {expected_cols}")
-                        
-                        # Save cleaned CSV to temporary file
-                        temp_file = file_path + '.cleaned'
-                        with open(temp_file, 'w', encoding='utf-8') as f:
-                            f.writelines(cleaned_lines)
-                        
-                        # Try to read the cleaned file
-                        df = pd.read_csv(temp_file, encoding='utf-8')
-                        logger.info(f"Manual cleaning successful! DataFrame shape: {df.shape}")
-                        
-                        # Clean up temp file
-                        os.remove(temp_file)
-                        
-                    except Exception as e:
-                        logger.error(f"Manual parsing also failed: {e}")
-                        raise HTTPException(status_code=400, detail=f"Unable to parse CSV file. The file appears to be malformed. Error: {str(e)}")
-                
-                if df is None:
-                    raise HTTPException(status_code=400, detail="Unable to read CSV file with any parsing strategy")
-                    
-            elif file_ext in ['.xlsx', '.xls']:
-                try:
-                    df = pd.read_excel(file_path)
-                except Exception as e:
-                    logger.error(f"Failed to read Excel file: {e}")
-                    raise HTTPException(status_code=400, detail=f"Failed to read Excel file: {str(e)}")
-            else:
-                raise HTTPException(status_code=400, detail="Unsupported file format")
-            
-            logger.info(f"Final DataFrame created with shape: {df.shape}")
-            
-        except HTTPException:
-            raise
+            table_info = data_manager.create_raw_table(file.filename, file_path)
         except Exception as e:
-            logger.error(f"Failed to read file: {e}")
-            raise HTTPException(status_code=400, detail=f"Failed to read file: {str(e)}")
+            if file_ext != '.csv':
+                logger.error(f"Failed to read Excel file: {e}")
+                raise HTTPException(status_code=400, detail=f"Failed to read Excel file: {str(e)}")
+            logger.warning(f"Native CSV load failed: {e}")
         
-        # Validate DataFrame
-        if df.empty:
+        # Files DuckDB couldn't load without rejecting rows, or that loaded empty, go through pandas
+        if file_ext == '.csv' and (table_info is None or table_info["rows"] == 0):
+            logger.info("Falling back to pandas CSV parsing...")
+            df = read_csv_with_pandas(file_path)
+            if df.empty:
+                raise HTTPException(status_code=400, detail="File is empty")
+            try:
+                table_info = data_manager.create_raw_table(file.filename, file_path, df)
+            except Exception as e:
+                logger.error(f"Failed to create table: {e}")
+                raise HTTPException(status_code=500, detail=f"Failed to create table: {str(e)}")
+        
+        # Validate table contents
+        if table_info["rows"] == 0:
             raise HTTPException(status_code=400, detail="File is empty")
         
-        # Create raw table
-        try:
-            table_name = data_manager.create_raw_table(file.filename, df)
-            logger.info(f"Created table: {table_name}")
-        except Exception as e:
-            logger.error(f"Failed to create table: {e}")
-            raise HTTPException(status_code=500, detail=f"Failed to create table: {str(e)}")
+        table_name = table_info["table_name"]
+        logger.info(f"Created table: {table_name}")
         
         # Create staging model
         staging_model = dbt_manager.create_staging_model(table_name)
@@ -502,10 +820,10 @@ async def upload_file(file: UploadFile = File(...)):
             "success": True,
             "filename": file.filename,
             "table_name": f"raw.{table_name}",
-            "rows": len(df),
-            "columns": list(df.columns),
+            "rows": table_info["rows"],
+            "columns": table_info["columns"],
             "staging_model": staging_model,
-            "message": f"Successfully uploaded {file.filename} with {len(df)} rows and {len(df.columns)} columns"
+            "message": f"Successfully uploaded {file.filename} with {table_info['rows']} rows and {len(table_info['columns'])} columns"
         }
         
         logger.info(f"Upload successful: {result}")
@@ -528,14 +846,17 @@ async def get_tables():
         return {"success": False, "error": str(e)}
 
 @app.post("/query")
-async def execute_query(query_data: dict):
-    """Execute SQL query"""
+async def execute_query(query_data: dict, format: str = "json"):
+    """Execute SQL query; pass ?format=arrow to get an Arrow IPC stream instead of JSON"""
     try:
         query = query_data.get("query", "").strip()
         if not query:
             raise HTTPException(status_code=400, detail="Query is required")
         
         logger.info(f"Executing query: {query[:100]}...")
+        if format == "arrow":
+            return StreamingResponse(data_manager.stream_query_arrow(query), media_type=ARROW_STREAM_MEDIA_TYPE)
+        
         result = data_manager.execute_query(query)
         return result
     
@@ -567,32 +888,8 @@ async def run_dbt_command(command: str):
 async def get_analytics():
     """Get platform analytics"""
     try:
-        tables = data_manager.get_tables()
-        
-        # Get row counts for each table
-        total_rows = 0
-        conn = duckdb.connect(DATABASE_PATH)
-        
-        for table in tables:
-            try:
-                result = conn.execute(f"SELECT COUNT(*) FROM {table['full_name']}").fetchone()
-                if result:
-                    total_rows += result[0]
-            except Exception as e:
-                logger.warning(f"Failed to count rows for {table['full_name']}: {e}")
-                continue
-        
-        conn.close()
-        
-        return {
-            "success": True,
-            "summary": {
-                "total_tables": len(tables),
-                "total_rows": total_rows,
-                "last_updated": datetime.now().isoformat(),
-                "schemas": list(set(table["schema"] for table in tables))
-            }
-        }
+        summary = data_manager.get_analytics()
+        return {"success": True, "summary": summary}
     
     except Exception as e:
         logger.error(f"Analytics error: {e}")
@@ -603,9 +900,7 @@ async def health_check():
     """Health check endpoint"""
     try:
         # Test database connection
-        conn = duckdb.connect(DATABASE_PATH)
-        conn.execute("SELECT 1").fetchone()
-        conn.close()
+        data_manager.conn.execute("SELECT 1").fetchone()
         
         return {
             "status": "healthy",
@@ -633,16 +928,26 @@ if __name__ == "__main__":
     print("📊 Access the app at: http://localhost:8000/app")
     print("📋 API docs at: http://localhost:8000/docs")
     print("🏥 Health check at: http://localhost:8000/health")
-    print("🔄 Auto-reload enabled for development")
+    
+    production = os.environ.get("ENV", "development") == "production"
+    if production:
+        print("⚡ Production mode: uvloop + httptools, auto-reload off")
+    else:
+        print("🔄 Auto-reload enabled for development (set ENV=production to disable)")
     
     # Test database on startup
     try:
-        conn = duckdb.connect(DATABASE_PATH)
-        conn.execute("SELECT 1").fetchone()
-        conn.close()
+        data_manager.conn.execute("SELECT 1").fetchone()
         print("✅ Database connection successful")
     except Exception as e:
         print(f"❌ Database connection failed: {e}")
     
+    # Release the file lock so the server process can open its own connection
+    data_manager.conn.close()
+    
     import uvicorn
-    uvicorn.run("backend:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
+    if production:
+        # Single worker: DuckDB allows only one read-write process per database file
+        uvicorn.run("backend:app", host="0.0.0.0", port=8000, loop="uvloop", http="httptools", reload=False)
+    else:
+        uvicorn.run("backend:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
@@ -1,27 +1,45 @@
 import streamlit as st
 import requests
 import pandas as pd
+import pyarrow as pa
 import plotly.express as px
 
 API_URL = "http://localhost:8000"
+ARROW_STREAM_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
 
 st.title("QueryVerse Basic")
 
+def run_query(sql: str) -> pd.DataFrame:
+    """Run SQL on the backend and decode its Arrow stream straight into Arrow-backed pandas"""
+    # The backend holds DuckDB's write lock on queryverse.db, so a read_only connection can't be
+    # opened here while it runs; Arrow IPC skips the JSON encode/decode and dict materialization
+    res = requests.post(f"{API_URL}/query", params={"format": "arrow"}, json={"query": sql})
+    if not res.headers.get("content-type", "").startswith(ARROW_STREAM_MEDIA_TYPE):
+        # Query errors come back as {"error": ...}; HTTPExceptions (e.g. an empty query) as {"detail": ...}
+        body = res.json()
+        raise RuntimeError(body.get("error") or body.get("detail") or "Query failed")
+    table = pa.ipc.open_stream(res.content).read_all()
+    return table.to_pandas(types_mapper=pd.ArrowDtype, split_blocks=True)
+
 uploaded_file = st.file_uploader("Upload CSV", type=["csv"])
 if uploaded_file is not None:
-    files = {"file": uploaded_file}
-    res = requests.post(f"{API_URL}/upload_csv/", files=files).json()
-    st.write(f"Columns: {res.get('columns')}")
-    st.write(f"Rows: {res.get('rows')}")
+    # Uploads still go through the backend, which owns all writes
+    files = {"file": (uploaded_file.name, uploaded_file.getvalue())}
+    res = requests.post(f"{API_URL}/upload", files=files).json()
+    if "detail" in res:
+        st.error(res["detail"])
+    else:
+        st.write(f"Columns: {res.get('columns')}")
+        st.write(f"Rows: {res.get('rows')}")
 
-    sql = st.text_area("Enter SQL Query", "SELECT * FROM data LIMIT 10")
-    if st.button("Run Query"):
-        query_res = requests.get(f"{API_URL}/query/", params={"sql": sql}).json()
-        if "error" in query_res:
-            st.error(query_res["error"])
-        else:
-            df = pd.DataFrame(query_res["rows"])
-            st.dataframe(df)
-            if not df.empty:
-                fig = px.bar(df, x=df.columns[0], y=df.columns[1])
-                st.plotly_chart(fig)
+        sql = st.text_area("Enter SQL Query", f"SELECT * FROM {res.get('table_name')} LIMIT 10")
+        if st.button("Run Query"):
+            try:
+                df = run_query(sql)
+            except Exception as e:
+                st.error(str(e))
+            else:
+                st.dataframe(df)
+                if not df.empty and len(df.columns) > 1:
+                    fig = px.bar(df, x=df.columns[0], y=df.columns[1])
+                    st.plotly_chart(fig)
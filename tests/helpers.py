@@ -0,0 +1,15 @@
+"""Shared setup for the backend tests"""
+import importlib
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def load_backend():
+    """Import backend once per test run from a scratch working directory"""
+    # backend opens ./queryverse.db and creates its folders on import, so keep them out of the repo
+    if "backend" not in sys.modules:
+        os.chdir(tempfile.mkdtemp())
+        sys.path.insert(0, ROOT)
+    return importlib.import_module("backend")
@@ -0,0 +1,64 @@
+"""Regression tests for the /query statement guard"""
+import time
+import unittest
+
+from helpers import load_backend
+
+backend = None
+
+def setUpModule():
+    global backend
+    backend = load_backend()
+
+class CheckQueryAllowedTest(unittest.TestCase):
+    def assertRejected(self, query):
+        with self.assertRaises(ValueError):
+            backend._check_query_allowed(query)
+
+    def test_rejects_destructive_statements(self):
+        self.assertRejected("DROP TABLE raw.x")
+        self.assertRejected("truncate raw.x")
+        self.assertRejected("ATTACH 'other.db'")
+        self.assertRejected("COPY raw.x TO 'out.csv'")
+
+    def test_quote_in_comment_does_not_hide_statements(self):
+        self.assertRejected("-- it's\nDROP TABLE marts.x; select 'a'")
+        self.assertRejected("/* it's */ DROP TABLE marts.x; select 'a'")
+
+    def test_comment_marker_in_literal_does_not_hide_statements(self):
+        self.assertRejected("SELECT '--'; DROP TABLE marts.x")
+        self.assertRejected("SELECT '/*'; DROP TABLE marts.x; SELECT '*/'")
+
+    def test_escaped_and_quoted_names_do_not_hide_statements(self):
+        self.assertRejected("SELECT E'\\''; DROP TABLE marts.x; SELECT '")
+        self.assertRejected('SELECT 1 AS "it\'s"; DROP TABLE marts.x; SELECT \'')
+
+    def test_allows_keywords_in_literals_comments_and_identifiers(self):
+        backend._check_query_allowed("SELECT * FROM raw.x WHERE status = 'drop' -- drop later")
+        backend._check_query_allowed('SELECT 1 AS "drop" /* truncate */')
+        backend._check_query_allowed("SELECT $$ATTACH$$")
+        backend._check_query_allowed("COPY raw.x FROM 'in.csv'")
+
+    def test_copy_to_is_checked_per_statement(self):
+        self.assertRejected("SELECT 1; COPY (SELECT 1) TO 'out.csv'")
+        backend._check_query_allowed("COPY raw.x FROM 'in.csv'; SELECT 1 AS to")
+
+    def test_adversarial_input_is_checked_in_linear_time(self):
+        # These used to backtrack quadratically and block the event loop for seconds
+        for query in ("copy " * 20000, "/* " * 20000, "$a$ " * 20000, "E'\\" * 20000):
+            start = time.perf_counter()
+            try:
+                backend._check_query_allowed(query)
+            except ValueError:
+                pass
+            self.assertLess(time.perf_counter() - start, 0.5, query[:10])
+
+    def test_query_endpoint_keeps_table(self):
+        conn = backend.data_manager.conn
+        conn.execute("CREATE TABLE marts.guard_probe AS SELECT 1 AS a")
+        result = backend.data_manager.execute_query("-- it's\nDROP TABLE marts.guard_probe; select 'a'")
+        self.assertFalse(result["success"])
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM marts.guard_probe").fetchone()[0], 1)
+
+if __name__ == "__main__":
+    unittest.main()
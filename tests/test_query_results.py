@@ -0,0 +1,23 @@
+"""Tests for the JSON shape of /query results"""
+import unittest
+from datetime import timedelta
+
+from helpers import load_backend
+
+backend = None
+
+def setUpModule():
+    global backend
+    backend = load_backend()
+
+class JsonResultsTest(unittest.TestCase):
+    def test_arrow_only_types_match_fetchall(self):
+        result = backend.data_manager.execute_query(
+            "SELECT INTERVAL 14 MONTH + INTERVAL 1 DAY AS i, MAP {'k': 1} AS m, '\\xAA'::BLOB AS b, "
+            "NULL::INTERVAL AS n"
+        )
+        self.assertTrue(result["success"])
+        self.assertEqual(result["data"], [{"i": timedelta(days=421), "m": {"k": 1}, "b": "aa", "n": None}])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,44 @@
+"""Tests for the staging views built by /dbt/run"""
+import os
+import unittest
+
+from helpers import load_backend
+
+backend = None
+
+def setUpModule():
+    global backend
+    backend = load_backend()
+
+def staging_views():
+    return {row[0] for row in backend.data_manager.conn.execute(
+        "SELECT table_name FROM information_schema.tables WHERE table_schema = 'staging'"
+    ).fetchall()}
+
+class StagingTest(unittest.TestCase):
+    def test_run_builds_every_table_in_parallel(self):
+        for name in ("stage_a", "stage_b", "stage_c"):
+            backend.data_manager.create_raw_table(f"{name}.csv", write_csv(f"{name}.csv", b"a\n1\n2\n"))
+        result = backend.dbt_manager.run_simple_dbt("run")
+        self.assertTrue(result["success"])
+        for name in ("stage_a", "stage_b", "stage_c"):
+            self.assertIn(f"✅ Transformed raw_{name} (2 rows)", result["stdout"])
+            self.assertIn(f"stg_raw_{name}", staging_views())
+
+    def test_failed_rebuild_keeps_previous_view(self):
+        backend.data_manager.create_raw_table("broken.csv", write_csv("broken.csv", b"a\n1\n"))
+        self.assertTrue(backend.dbt_manager.run_transformation("raw_broken")["success"])
+
+        # The raw view can no longer bind once its Parquet file is gone
+        os.remove(os.path.join(backend.UPLOAD_DIR, "raw_broken.parquet"))
+        self.assertFalse(backend.dbt_manager.run_transformation("raw_broken")["success"])
+        self.assertIn("stg_raw_broken", staging_views())
+
+def write_csv(filename, content):
+    path = os.path.join(backend.UPLOAD_DIR, filename)
+    with open(path, "wb") as f:
+        f.write(content)
+    return path
+
+if __name__ == "__main__":
+    unittest.main()
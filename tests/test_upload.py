@@ -0,0 +1,58 @@
+"""Upload tests; run them in an environment installed from requirements.txt so the pinned DuckDB is used"""
+import asyncio
+import io
+import unittest
+
+from fastapi import HTTPException, UploadFile
+
+from helpers import load_backend
+
+backend = None
+
+def setUpModule():
+    global backend
+    backend = load_backend()
+
+def upload(filename, content):
+    return asyncio.run(backend.upload_file(UploadFile(io.BytesIO(content), filename=filename)))
+
+def query(sql):
+    return backend.data_manager.conn.execute(sql).fetchall()
+
+class UploadTest(unittest.TestCase):
+    def test_csv_upload(self):
+        result = upload("plain.csv", b"a,b\n1,x\n2,y\n")
+        self.assertTrue(result["success"])
+        self.assertEqual(result["rows"], 2)
+        self.assertEqual(query("SELECT a, b FROM raw.raw_plain ORDER BY a"), [(1, "x"), (2, "y")])
+
+    def test_latin1_csv_keeps_every_row(self):
+        lines = ["name,n"] + [f"p{i},{i}" for i in range(100)] + ["José,100"]
+        with self.assertLogs("backend", "INFO") as logs:
+            result = upload("latin.csv", "\n".join(lines).encode("latin-1"))
+        # Reloaded natively as latin-1 rather than through the pandas fallback
+        self.assertTrue(any("reloading it as latin-1" in line for line in logs.output))
+        self.assertEqual(result["rows"], 101)
+        self.assertEqual(query("SELECT name FROM raw.raw_latin WHERE n = 100"), [("José",)])
+
+    def test_duplicate_headers_are_suffixed(self):
+        result = upload("dupes.csv", b"a b,a-b\n1,2\n")
+        self.assertEqual(result["columns"], ["a_b", "a_b_1"])
+
+    def test_user_reject_errors_table_survives_upload(self):
+        backend.data_manager.conn.execute("CREATE TABLE main.reject_errors AS SELECT 1 AS kept")
+        try:
+            upload("rejects.csv", b"a\n1\n")
+            self.assertEqual(query("SELECT kept FROM main.reject_errors"), [(1,)])
+        finally:
+            backend.data_manager.conn.execute("DROP TABLE IF EXISTS main.reject_errors")
+
+    def test_empty_reupload_keeps_existing_data(self):
+        upload("keep.csv", b"a,b\n1,2\n")
+        with self.assertRaises(HTTPException) as ctx:
+            upload("keep.csv", b"a,b\n")
+        self.assertEqual(ctx.exception.status_code, 400)
+        self.assertEqual(query("SELECT a, b FROM raw.raw_keep"), [(1, 2)])
+
+if __name__ == "__main__":
+    unittest.main()